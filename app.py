@@ -1,7 +1,9 @@
-from flask import Flask, render_template, jsonify, request, session
+from flask import Flask, Response, render_template, jsonify, request, session
+from flask.json.provider import JSONProvider
+from flask_session import Session
+from cachelib import FileSystemCache
 from langchain_pinecone import PineconeVectorStore
 from langchain_openai import AzureChatOpenAI
-from langchain_openai import AzureOpenAIEmbeddings
 from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import ChatPromptTemplate
@@ -9,18 +11,42 @@ from dotenv import load_dotenv
 from src.prompt import *
 from src.helper import (
     allowed_file,
-    create_nutrition_analysis_chain
+    aretrieve_multi,
+    build_product_context,
+    create_async_http_client,
+    create_http_client,
+    create_nutrition_analysis_chain,
+    precompute_answers,
+    query_hash,
+    rewrite_query
 )
-from openai import AzureOpenAI
+from src.cache import CachedEmbeddings, ResultStore, SingleFlight, hash_text
+from openai import AzureOpenAI, AsyncAzureOpenAI
+import redis
+import asyncio
+import threading
+import hashlib
+import uuid
+import orjson
 import os
 from werkzeug.utils import secure_filename
 from datetime import datetime
 
+class OrjsonProvider(JSONProvider):
+    """Serve jsonify responses and parse request JSON with orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.secret_key = os.urandom(24)  # For session management
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+app.config['ALLOWED_EXTENSIONS'] = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
 
 # Create upload folder if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -29,6 +55,7 @@ load_dotenv()
 
 NETAICONNECT_API_KEY = os.getenv("NETAICONNECT_API_KEY")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+REDIS_URL = os.getenv("REDIS_URL")
 
 os.environ["PINECONE_API_KEY"] = PINECONE_API_KEY
 os.environ["NETAICONNECT_API_KEY"] = NETAICONNECT_API_KEY
@@ -51,11 +78,33 @@ POSITIVE_FACTOR_THRESHOLD = {
     "fiber": {"high_threshold_percent": 20, "source_threshold_percent": 10}
 }
 
-embeddings = AzureOpenAIEmbeddings(
+# Optional shared Redis cache (in-process caching only when REDIS_URL is not set)
+redis_client = redis.Redis.from_url(REDIS_URL) if REDIS_URL else None
+
+# Server-side sessions: the cookie only carries the session id, the product
+# analysis is stored in Redis (or on local disk when Redis is not configured)
+if redis_client is not None:
+    app.config['SESSION_TYPE'] = 'redis'
+    app.config['SESSION_REDIS'] = redis_client
+else:
+    app.config['SESSION_TYPE'] = 'cachelib'
+    app.config['SESSION_CACHELIB'] = FileSystemCache(cache_dir='flask_session', threshold=500)
+Session(app)
+
+# Pooled keep-alive HTTP clients shared by every Azure OpenAI client; the async
+# one is only used from the shared event loop below
+http_client = create_http_client()
+async_http_client = create_async_http_client()
+
+# Query embeddings are cached (LRU + Redis) so repeated questions skip the API call
+embeddings = CachedEmbeddings(
     model="text-embedding-ada-002",
     azure_endpoint="https://netaiconnect.netapp.com/",
     api_key=NETAICONNECT_API_KEY,
     openai_api_version="2023-05-15",
+    redis_client=redis_client,
+    http_client=http_client,
+    http_async_client=async_http_client,
 )
 
 index_name = "purecheck-index"
@@ -74,7 +123,9 @@ chatModel = AzureChatOpenAI(
     api_key=NETAICONNECT_API_KEY,
     azure_endpoint='https://netaiconnect.netapp.com/',
     api_version='2023-05-15',
-    temperature=0.0
+    temperature=0.0,
+    http_client=http_client,
+    http_async_client=async_http_client
 )
 
 # Create RAG chain for FSSAI questions
@@ -88,23 +139,120 @@ prompt = ChatPromptTemplate.from_messages([
     ("human", "{input}")
 ])
 
-question_answer_chain = create_stuff_documents_chain(chatModel, prompt)
-rag_chain = create_retrieval_chain(retriever, question_answer_chain)
+# Runnables are bound once with a fixed config and no callbacks so each call
+# skips the default callback-manager setup
+CHAT_RUN_CONFIG = {"tags": ["chat"], "callbacks": []}
+
+# create_retrieval_chain needs the plain BaseRetriever to extract "input" from
+# its payload, so the configured binding gets its own name
+chat_retriever = retriever.with_config({**CHAT_RUN_CONFIG, "run_name": "fssai_retriever"})
+question_answer_chain = create_stuff_documents_chain(chatModel, prompt).with_config(
+    {**CHAT_RUN_CONFIG, "run_name": "fssai_answer"}
+)
+rag_chain = create_retrieval_chain(retriever, question_answer_chain).with_config(
+    {**CHAT_RUN_CONFIG, "run_name": "fssai_rag"}
+)
+
+# Answer the most common FSSAI questions once at startup so they skip Pinecone + GPT-4o.
+# With Redis the answers are shared, so only one worker computes them; the debug
+# reloader's parent process never serves requests and skips the warmup. It runs in
+# a background thread so importing the app (and gunicorn's worker boot) isn't held up
+precomputed_answers = ResultStore(redis_client, prefix="answer:", ttl=7 * 24 * 3600)
+if not (__name__ == '__main__' and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'):
+    threading.Thread(
+        target=precompute_answers,
+        args=(rag_chain, 'warmup_queries.json', precomputed_answers),
+        daemon=True
+    ).start()
 
 # Initialize o3-mini client for reasoning
 o3_client = AzureOpenAI(
     api_key=NETAICONNECT_API_KEY,
     api_version="2024-12-01-preview",
-    azure_endpoint="https://netaiconnect.netapp.com/"
+    azure_endpoint="https://netaiconnect.netapp.com/",
+    http_client=http_client
+)
+
+o3_async_client = AsyncAzureOpenAI(
+    api_key=NETAICONNECT_API_KEY,
+    api_version="2024-12-01-preview",
+    azure_endpoint="https://netaiconnect.netapp.com/",
+    http_client=async_http_client
 )
 
-# Create nutrition analysis chain
+# Create nutrition analysis chain; re-uploads of the same label are served
+# from the content-hash caches instead of calling GPT-4o Vision / o3-mini again
 nutrition_analysis_chain = create_nutrition_analysis_chain(
     api_key=NETAICONNECT_API_KEY,
     fssai_inr_baseline=FSSAI_INR_BASELINE,
-    o3_client=o3_client
+    o3_client=o3_client,
+    o3_async_client=o3_async_client,
+    vision_cache=ResultStore(redis_client, prefix="vision:", ttl=30 * 24 * 3600),
+    inr_cache=ResultStore(redis_client, prefix="inr:", ttl=30 * 24 * 3600)
 )
 
+# Long-lived event loop for async LLM calls; the async clients keep their
+# connection pools across requests because they always run on this loop
+async_loop = asyncio.new_event_loop()
+threading.Thread(target=async_loop.run_forever, daemon=True).start()
+
+def run_async(coro):
+    """Run a coroutine on the shared event loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, async_loop).result()
+
+def save_upload(file):
+    """Stream an uploaded file to disk with a timestamped secure name and return (filename, filepath, sha256)"""
+    filename = secure_filename(file.filename)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    filename = f"{timestamp}_{filename}"
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    digest = hashlib.sha256()
+    with open(filepath, 'wb') as out:
+        for block in iter(lambda: file.stream.read(1 << 20), b''):
+            digest.update(block)
+            out.write(block)
+    return filename, filepath, digest.hexdigest()
+
+# Identical concurrent uploads share one analysis job, identical concurrent
+# chat requests share one model call
+upload_flights = SingleFlight()
+chat_flights = SingleFlight()
+
+def stream_fssai_answer(msg):
+    """Stream the answer to a general FSSAI question, retrieving for the question and its keyword rewrite concurrently"""
+    docs = run_async(aretrieve_multi(chat_retriever, [msg, rewrite_query(msg)]))
+    yield from question_answer_chain.stream({"input": msg, "context": docs})
+
+def sse_event(payload):
+    """Format a payload as a Server-Sent Event"""
+    return f"data: {orjson.dumps(payload).decode()}\n\n"
+
+# Background analysis jobs; stored in Redis when configured so any worker can answer /result
+job_store = ResultStore(redis_client, prefix="job:", ttl=24 * 3600)
+
+async def run_analysis_job(job_id, filename, filepath, image_hash, flight):
+    """Run the nutrition analysis chain for an upload and record the outcome"""
+    try:
+        try:
+            chain_result = await nutrition_analysis_chain.ainvoke(filepath)
+            if chain_result['success']:
+                # Chat prompt is formatted once here; a malformed INR result fails the job cleanly
+                chain_result['context_template'] = build_product_context(
+                    chain_result['product_data'], chain_result['inr_result']
+                )
+        except Exception as e:
+            chain_result = {'success': False, 'error': str(e)}
+        
+        # Blocking Redis write; keep it off the shared event loop
+        await asyncio.to_thread(job_store.set, job_id, {
+            'status': 'done' if chain_result['success'] else 'error',
+            'filename': filename,
+            'filepath': filepath,
+            'result': chain_result
+        })
+    finally:
+        upload_flights.end(image_hash, flight)
+
 # Routes
 @app.route('/')
 def index():
@@ -113,7 +261,7 @@ def index():
 
 @app.route('/upload', methods=['POST'])
 def upload_image():
-    """Handle image upload and analyze nutrition"""
+    """Handle image upload and start the nutrition analysis in the background"""
     if 'image' not in request.files:
         return jsonify({'error': 'No image file provided'}), 400
     
@@ -125,44 +273,129 @@ def upload_image():
     if not allowed_file(file.filename, app.config['ALLOWED_EXTENSIONS']):
         return jsonify({'error': 'Invalid file type. Please upload an image (PNG, JPG, JPEG, GIF, WEBP)'}), 400
     
+    is_leader = False
     try:
         # Save the uploaded file
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{timestamp}_{filename}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        # Execute the nutrition analysis chain (LangChain SequentialChain)
-        # This chain handles: extraction -> analysis -> INR score calculation
-        chain_result = nutrition_analysis_chain.invoke(filepath)
+        filename, filepath, image_hash = save_upload(file)
         
-        if not chain_result['success']:
-            return jsonify({
-                'error': chain_result.get('error', 'Analysis failed'),
-                'details': chain_result.get('details')
-            }), 500
+        # The same image is already being analysed: follow that job
+        future, is_leader = upload_flights.begin(image_hash)
+        if not is_leader:
+            os.remove(filepath)
+            return jsonify({'success': True, 'job_id': future.result(timeout=30)}), 202
         
-        # Extract results from chain
-        product_data = chain_result['product_data']
-        analysis = chain_result['analysis']
-        inr_result = chain_result['inr_result']
+        # Run the nutrition analysis chain (extraction -> analysis -> INR score)
+        # in the background; the client polls /result/<job_id>
+        job_id = uuid.uuid4().hex
+        job_store.set(job_id, {'status': 'pending'})
+        asyncio.run_coroutine_threadsafe(
+            run_analysis_job(job_id, filename, filepath, image_hash, future), async_loop
+        )
+        future.set_result(job_id)
         
-        # Store in session for chat context
-        session['current_product'] = {
-            'product_data': product_data,
-            'analysis': analysis,
-            'inr_result': inr_result,
-            'image_path': filepath
-        }
+        return jsonify({'success': True, 'job_id': job_id}), 202
         
+    except Exception as e:
+        if is_leader:
+            # Release the key so waiting and later uploads of this image don't hang
+            if not future.done():
+                future.set_exception(e)
+            upload_flights.end(image_hash, future)
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/result/<job_id>', methods=['GET'])
+def get_result(job_id):
+    """Return the status or result of a background analysis job"""
+    job = job_store.get(job_id)
+    
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    
+    if job['status'] == 'pending':
+        return jsonify({'success': True, 'status': 'pending'}), 202
+    
+    chain_result = job['result']
+    
+    if job['status'] == 'error':
         return jsonify({
-            'success': True,
-            'product_data': product_data,
-            'analysis': analysis,
-            'inr_result': inr_result,
-            'image_path': filename
-        })
+            'error': chain_result.get('error', 'Analysis failed'),
+            'details': chain_result.get('details')
+        }), 500
+    
+    # Extract results from chain
+    product_data = chain_result['product_data']
+    analysis = chain_result['analysis']
+    inr_result = chain_result['inr_result']
+    
+    # Store in session for chat context
+    session['current_product'] = {
+        'product_data': product_data,
+        'analysis': analysis,
+        'inr_result': inr_result,
+        'image_path': job['filepath'],
+        'context_template': chain_result['context_template']
+    }
+    
+    return jsonify({
+        'success': True,
+        'status': 'done',
+        'product_data': product_data,
+        'analysis': analysis,
+        'inr_result': inr_result,
+        'image_path': job['filename']
+    })
+
+
+@app.route('/upload-batch', methods=['POST'])
+def upload_batch():
+    """Analyze several product images concurrently"""
+    files = request.files.getlist('images')
+    
+    if not files:
+        return jsonify({'error': 'No image files provided'}), 400
+    
+    for file in files:
+        if file.filename == '' or not allowed_file(file.filename, app.config['ALLOWED_EXTENSIONS']):
+            return jsonify({'error': f"Invalid file: '{file.filename}'. Please upload images (PNG, JPG, JPEG, GIF, WEBP)"}), 400
+    
+    try:
+        saved = [save_upload(file)[:2] for file in files]
+        
+        async def analyze_all():
+            # One failing image (API error, timeout, rate limit) must not discard the others
+            return await asyncio.gather(
+                *[nutrition_analysis_chain.ainvoke(filepath) for _, filepath in saved],
+                return_exceptions=True
+            )
+        
+        chain_results = run_async(analyze_all())
+        
+        results = []
+        for (filename, _), chain_result in zip(saved, chain_results):
+            if isinstance(chain_result, Exception):
+                results.append({
+                    'success': False,
+                    'error': str(chain_result),
+                    'image_path': filename
+                })
+            elif chain_result['success']:
+                results.append({
+                    'success': True,
+                    'product_data': chain_result['product_data'],
+                    'analysis': chain_result['analysis'],
+                    'inr_result': chain_result['inr_result'],
+                    'image_path': filename
+                })
+            else:
+                results.append({
+                    'success': False,
+                    'error': chain_result.get('error', 'Analysis failed'),
+                    'details': chain_result.get('details'),
+                    'image_path': filename
+                })
+        
+        return jsonify({'success': True, 'results': results})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -170,7 +403,7 @@ def upload_image():
 
 @app.route('/chat', methods=['POST'])
 def chat():
-    """Handle chat messages about the analyzed product or FSSAI questions"""
+    """Handle chat messages about the analyzed product or FSSAI questions, streamed as Server-Sent Events"""
     # Get message from JSON data
     data = request.get_json()
     msg = data.get('message', '')
@@ -186,51 +419,65 @@ def chat():
         
         if current_product:
             # Product-specific chat with context
-            product_context = f"""
-
-Current Product Analysis:
-- Product: {current_product['product_data'].get('product_name', 'Unknown')}
-- Brand: {current_product['product_data'].get('brand', 'Unknown')}
-- Type: {current_product['product_data'].get('product_type', 'Solid')}
-- INR Score: {current_product['inr_result']['inr_score']:.1f}/100
-- Grade: {current_product['inr_result']['grade']}
-- Energy: {current_product['product_data']['nutritional_info_per_100g']['energy_kcal']} kcal/100g
-- Sugars: {current_product['product_data']['nutritional_info_per_100g']['sugars_g']} g/100g
-- Saturated Fat: {current_product['product_data']['nutritional_info_per_100g']['saturated_fat_g']} g/100g
-- Sodium: {current_product['product_data']['nutritional_info_per_100g']['sodium_mg']} mg/100g
-- Protein: {current_product['product_data']['nutritional_info_per_100g']['protein_g']} g/100g
-
-Health Warnings: {', '.join(current_product['inr_result'].get('health_warnings', [])) or 'None'}
-Positive Claims: {', '.join(current_product['inr_result'].get('positive_claims', [])) or 'None'}
-
-You are the CPG (Compliance and Product Guidance) assistant for FSSAI regulations and nutrition guidelines.
-Pin-point your answers based on the product data provided above.
-Tell where the guidlines fails. Which clause is violated.
-
-
-User Question: {msg}
-
-Format your response with:
-- Use **bold** for important terms (wrap text in **)
-- Use bullet points with "- " for lists
-- Be concise and friendly
-- Include relevant emojis where appropriate
-"""
+            # Product details were formatted once at upload; only the question is substituted
+            context_template = current_product.get('context_template') or build_product_context(
+                current_product['product_data'], current_product['inr_result']
+            )
+            product_context = context_template.replace('{user_msg}', msg)
             # Use chatModel directly for product-specific questions
-            response_obj = chatModel.invoke(product_context)
-            response_text = response_obj.content
+            deltas = (chunk.content for chunk in chatModel.stream(product_context))
+            flight_key = "product:" + hash_text(product_context)
             
         else:
-            # General FSSAI chat using RAG chain
-            response = rag_chain.invoke({"input": msg})
-            response_text = response["answer"]
-        
-        print(f"Response: {response_text}")
-        return jsonify({'success': True, 'response': response_text})
+            # Common FSSAI questions are served from the warmup answers
+            precomputed = precomputed_answers.get(query_hash(msg))
+            
+            # General FSSAI chat using RAG
+            deltas = iter([precomputed]) if precomputed is not None else stream_fssai_answer(msg)
+            flight_key = None if precomputed is not None else "rag:" + query_hash(msg)
         
     except Exception as e:
         print(f"Error: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
+    
+    def generate():
+        future, is_leader = chat_flights.begin(flight_key) if flight_key else (None, True)
+        
+        if not is_leader:
+            # An identical request is already calling the model: send its answer
+            try:
+                yield sse_event({'delta': future.result(timeout=120)})
+                yield sse_event({'done': True})
+            except Exception as e:
+                yield sse_event({'error': str(e)})
+            return
+        
+        response_text = []
+        try:
+            for delta in deltas:
+                if delta:
+                    response_text.append(delta)
+                    yield sse_event({'delta': delta})
+            print(f"Response: {''.join(response_text)}")
+            if future:
+                future.set_result(''.join(response_text))
+            yield sse_event({'done': True})
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            if future:
+                future.set_exception(e)
+            yield sse_event({'error': str(e)})
+        finally:
+            if future:
+                if not future.done():
+                    # Client disconnected before the answer was complete
+                    future.set_exception(RuntimeError('Request was cancelled'))
+                chat_flights.end(flight_key, future)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 @app.route('/clear-session', methods=['POST'])
 def clear_session():
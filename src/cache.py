@@ -0,0 +1,221 @@
+"""
+Caching helpers for PureCheck - Food Product Analysis
+"""
+
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, List, Optional
+
+import numpy as np
+import orjson
+from langchain_openai import AzureOpenAIEmbeddings
+from pydantic import PrivateAttr
+from redis.exceptions import RedisError
+
+
+def hash_text(text):
+    """
+    Build a cache key for a piece of text.
+
+    Args:
+        text (str): Text to hash (stripped and lowercased before hashing)
+
+    Returns:
+        str: SHA-256 hex digest of the normalized text
+    """
+    return hashlib.sha256(text.strip().lower().encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """Small thread-safe in-memory LRU cache."""
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def add(self, key, value):
+        """Set key only if it is absent. Returns True if the value was added."""
+        with self._lock:
+            if key in self._data:
+                return False
+            self._data[key] = value
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return True
+
+
+class ResultStore:
+    """
+    JSON key-value store with a TTL.
+
+    Uses Redis when a client is given, so entries are visible to every worker
+    process, and falls back to an in-process LRU otherwise.
+    """
+
+    def __init__(self, redis_client=None, prefix="", ttl=24 * 3600, maxsize=1000):
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.ttl = ttl
+        self._local = LRUCache(maxsize=maxsize)
+
+    def get(self, key):
+        if self.redis_client is None:
+            return self._local.get(key)
+        try:
+            value = self.redis_client.get(self.prefix + key)
+        except RedisError:
+            return None
+        return orjson.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        if self.redis_client is None:
+            self._local.set(key, value)
+            return
+        try:
+            self.redis_client.set(self.prefix + key, orjson.dumps(value), ex=self.ttl)
+        except RedisError:
+            pass
+
+    def delete(self, key):
+        if self.redis_client is None:
+            self._local.delete(key)
+            return
+        try:
+            self.redis_client.delete(self.prefix + key)
+        except RedisError:
+            pass
+
+    def claim(self, key, ttl=None):
+        """Atomically mark key as taken for ttl seconds; only the first caller (across workers with Redis) gets True."""
+        if self.redis_client is None:
+            return self._local.add(key, True)
+        try:
+            return bool(self.redis_client.set(self.prefix + key, orjson.dumps(True), nx=True, ex=ttl or self.ttl))
+        except RedisError:
+            return True
+
+
+class SingleFlight:
+    """
+    In-process de-duplication of identical concurrent work.
+
+    The first caller for a key becomes the leader and must resolve the
+    returned Future and then call end(key); concurrent callers with the
+    same key get the same Future and wait on it instead of repeating the work.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """Return (future, is_leader) for key."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+
+    def end(self, key, future=None):
+        """Forget key so the next caller starts a fresh computation (only if it still maps to future, when given)."""
+        with self._lock:
+            if future is None or self._inflight.get(key) is future:
+                self._inflight.pop(key, None)
+
+
+class CachedEmbeddings(AzureOpenAIEmbeddings):
+    """
+    AzureOpenAIEmbeddings with a two-level cache in front of the API.
+
+    L1 is an in-process LRU of float32 arrays keyed by the SHA-256 of the normalized text.
+    L2 is Redis (optional, shared between workers): vectors are stored as
+    FLOAT32 bytes with a TTL under the same key.
+    """
+
+    redis_client: Any = None
+    cache_ttl: int = 7 * 24 * 3600
+    l1_maxsize: int = 1000
+    redis_prefix: str = "emb:"
+
+    _l1: LRUCache = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: Any) -> None:
+        super().model_post_init(__context)
+        self._l1 = LRUCache(maxsize=self.l1_maxsize)
+
+    def _lookup(self, key):
+        vector = self._l1.get(key)
+        if vector is None and self.redis_client is not None:
+            try:
+                blob = self.redis_client.get(self.redis_prefix + key)
+            except RedisError:
+                return None
+            if blob is None:
+                return None
+            vector = np.frombuffer(blob, dtype=np.float32)
+            self._l1.set(key, vector)
+        return vector.tolist() if vector is not None else None
+
+    def _store(self, key, vector):
+        # L1 keeps the float32 array (~6KB for 1536 dims) rather than a list of Python floats
+        vector = np.asarray(vector, dtype=np.float32)
+        self._l1.set(key, vector)
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.set(self.redis_prefix + key, vector.tobytes(), ex=self.cache_ttl)
+        except RedisError:
+            pass
+
+    def embed_query(self, text: str) -> List[float]:
+        key = hash_text(text)
+        vector = self._lookup(key)
+        if vector is None:
+            vector = super().embed_query(text)
+            self._store(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        # Redis calls are blocking; keep them off the shared event loop
+        key = hash_text(text)
+        vector = await asyncio.to_thread(self._lookup, key)
+        if vector is None:
+            vector = await super().aembed_query(text)
+            await asyncio.to_thread(self._store, key, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str], chunk_size: Optional[int] = None) -> List[List[float]]:
+        keys = [hash_text(text) for text in texts]
+        vectors = [self._lookup(key) for key in keys]
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            fresh = super().embed_documents([texts[i] for i in missing], chunk_size=chunk_size)
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+                self._store(keys[i], vector)
+        return vectors
@@ -2,28 +2,132 @@
 Helper functions for PureCheck - Food Product Analysis
 """
 
+import asyncio
 import base64
+import functools
+import glob
+import hashlib
+import io
+import itertools
+import mimetypes
 import os
 import json
-from openai import AzureOpenAI
+import re
+import uuid
+import httpx
+import orjson
+import tiktoken
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from PIL import Image, ImageOps
+from openai import AzureOpenAI, AsyncAzureOpenAI
 from langchain_community.document_loaders import PDFPlumberLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from src.prompt import NUTRITION_EXTRACTION_PROMPT
+from src.prompt import NUTRITION_EXTRACTION_PROMPT, PRODUCT_CONTEXT_TEMPLATE
 from typing import List
 from langchain.schema import Document
-from langchain_community.document_loaders import DirectoryLoader
+
+
+def _load_one_pdf(pdf_path):
+    """Load a single PDF (runs in a worker process)."""
+    return PDFPlumberLoader(pdf_path).load()
+
+
+def load_pdfs(pdf_paths):
+    """
+    Load PDF files in parallel, one worker process per CPU.
+    
+    Args:
+        pdf_paths (List[str]): Paths of the PDF files
+        
+    Returns:
+        List[Document]: Pages of all PDFs, in input order
+    """
+    if not pdf_paths:
+        return []
+    
+    max_workers = min(len(pdf_paths), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(itertools.chain.from_iterable(executor.map(_load_one_pdf, pdf_paths)))
+
+
+def find_pdfs(file_path):
+    """Return the sorted paths of all PDFs under file_path."""
+    return sorted(glob.glob(os.path.join(file_path, "**", "*.pdf"), recursive=True))
 
 
 def upload_pdf(file_path):
     print(f"Loading PDF document from: {file_path}")
-    loader = DirectoryLoader(
-                    file_path, 
-                    glob="**/*.pdf", 
-                    loader_cls=PDFPlumberLoader
-                )
-    documents = loader.load()
+    documents = load_pdfs(find_pdfs(file_path))
     return documents
 
+
+def file_sha256(path):
+    """SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_index_manifest(manifest_path):
+    """
+    Load the record of which PDFs are already indexed.
+    
+    Args:
+        manifest_path (str): Path of the JSON manifest
+        
+    Returns:
+        dict: pdf path -> {"mtime", "sha256", "vector_ids"}
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_index_manifest(manifest_path, manifest):
+    """Write the index manifest to disk (atomically, so an interrupted run never truncates it)."""
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def diff_index_manifest(pdf_paths, manifest):
+    """
+    Work out which PDFs need to be (re-)indexed.
+    
+    A file is unchanged when its mtime matches the manifest, or when its
+    content hash does even though the mtime moved (e.g. after a fresh checkout).
+    
+    Args:
+        pdf_paths (List[str]): PDFs currently on disk
+        manifest (dict): Previously saved manifest
+        
+    Returns:
+        tuple: (changed paths, removed paths, {path: {"mtime", "sha256"}} for changed paths)
+    """
+    changed, fingerprints = [], {}
+    for path in pdf_paths:
+        mtime = os.path.getmtime(path)
+        entry = manifest.get(path)
+        if entry and entry["mtime"] == mtime:
+            continue
+        
+        sha256 = file_sha256(path)
+        if entry and entry["sha256"] == sha256:
+            entry["mtime"] = mtime
+            continue
+        
+        changed.append(path)
+        fingerprints[path] = {"mtime": mtime, "sha256": sha256}
+    
+    current = set(pdf_paths)
+    removed = [path for path in manifest if path not in current]
+    return changed, removed, fingerprints
+
 # filtering the documents structure
 def filter_to_minimal_docs(docs: List[Document]) -> List[Document]:
     minimal_docs = []
@@ -43,32 +147,315 @@ def text_split(minimal_docs):
     text_chunks = text_splitter.split_documents(minimal_docs)
     return text_chunks
 
-def encode_image_to_base64(image_path):
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query):
     """
-    Encode an image file to base64 string.
+    Normalize a chat question so trivially different phrasings share a cache key.
+    
+    Args:
+        query (str): Raw user question
+        
+    Returns:
+        str: Lowercased question with punctuation removed and whitespace collapsed
+    """
+    query = _PUNCTUATION_RE.sub(" ", query.lower())
+    return _WHITESPACE_RE.sub(" ", query).strip()
+
+
+def query_hash(query):
+    """
+    SHA-256 of the normalized query, used as the key for precomputed answers.
+    
+    Args:
+        query (str): Raw user question
+        
+    Returns:
+        str: Hex digest
+    """
+    return hashlib.sha256(normalize_query(query).encode('utf-8')).hexdigest()
+
+
+_QUERY_STOPWORDS = frozenset("""
+a an the is are was were be been am do does did can could should would will shall may might must
+what which who whom whose when where why how tell me about please explain i we you it its this that
+these those of for to in on at by with from as and or any there my our your give list
+""".split())
+
+
+def rewrite_query(query):
+    """
+    Keyword form of a question, used as a second retrieval query.
+    
+    Args:
+        query (str): Raw user question
+        
+    Returns:
+        str: Normalized question with question words and stopwords removed
+    """
+    return " ".join(word for word in normalize_query(query).split() if word not in _QUERY_STOPWORDS)
+
+
+async def aretrieve_multi(retriever, queries):
+    """
+    Run several retrieval queries concurrently and merge the results.
+    
+    Args:
+        retriever: LangChain retriever
+        queries (List[str]): Queries to run; empty and duplicate queries are skipped
+        
+    Returns:
+        List[Document]: Retrieved documents without duplicates, first query's results first
+    """
+    unique_queries = list(dict.fromkeys(query for query in queries if query.strip()))
+    results = await asyncio.gather(*[retriever.ainvoke(query) for query in unique_queries])
+    
+    seen = set()
+    documents = []
+    for doc in itertools.chain.from_iterable(results):
+        if doc.page_content not in seen:
+            seen.add(doc.page_content)
+            documents.append(doc)
+    return documents
+
+
+def precompute_answers(rag_chain, queries_path, answer_store, max_concurrency=8):
+    """
+    Run the RAG chain for each warmup query and keep the answers in answer_store.
+    
+    Queries already answered in the store are skipped, and only the worker
+    that claims the warmup computes the rest, so with a shared Redis store
+    the answers are computed once for all workers and restarts. Each answer
+    is stored as soon as it completes; if any query fails the claim is
+    dropped so the next worker to start retries the missing ones.
+    
+    Args:
+        rag_chain: LangChain retrieval chain
+        queries_path (str): Path to a JSON list of common questions
+        answer_store (ResultStore): Store for query_hash -> answer
+        max_concurrency (int): Number of warmup queries run at once
+    """
+    if not os.path.exists(queries_path):
+        return
+    
+    with open(queries_path, "r", encoding="utf-8") as f:
+        queries = json.load(f)
+    
+    queries = [query for query in queries if answer_store.get(query_hash(query)) is None]
+    if not queries or not answer_store.claim("warmup", ttl=600):
+        return
+    
+    print(f"Precomputing answers for {len(queries)} warmup queries")
+    complete = False
+    try:
+        failures = 0
+        for i, response in rag_chain.batch_as_completed(
+            [{"input": query} for query in queries],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True
+        ):
+            if isinstance(response, Exception):
+                print(f"Warmup failed for '{queries[i]}': {str(response)}")
+                failures += 1
+            else:
+                answer_store.set(query_hash(queries[i]), response["answer"])
+        complete = failures == 0
+    finally:
+        if not complete:
+            answer_store.delete("warmup")
+
+
+def batch_by_tokens(texts, max_tokens=250_000, max_items=2048, model="text-embedding-ada-002"):
+    """
+    Greedily pack texts into embedding requests under the provider limits.
+    
+    Args:
+        texts (List[str]): Texts to embed
+        max_tokens (int): Maximum total tokens per embedding request
+        max_items (int): Maximum number of inputs per embedding request
+        model (str): Embedding model name, used to pick the tokenizer
+        
+    Returns:
+        List[List[int]]: Batches of indices into texts
+    """
+    encoding = tiktoken.encoding_for_model(model)
+    token_counts = [len(tokens) for tokens in encoding.encode_batch(texts)]
+    
+    batches = []
+    current, current_tokens = [], 0
+    for i, count in enumerate(token_counts):
+        if current and (current_tokens + count > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += count
+    if current:
+        batches.append(current)
+    return batches
+
+
+def embed_in_batches(embeddings, texts, max_workers=8):
+    """
+    Embed texts using large token-packed batches sent concurrently.
+    
+    Args:
+        embeddings: LangChain embeddings object
+        texts (List[str]): Texts to embed
+        max_workers (int): Number of concurrent embedding requests
+        
+    Returns:
+        List[List[float]]: One vector per text, in input order
+    """
+    batches = batch_by_tokens(texts)
+    print(f"Embedding {len(texts)} chunks in {len(batches)} requests")
+    
+    def embed_batch(batch):
+        return embeddings.embed_documents([texts[i] for i in batch])
+    
+    vectors = [None] * len(texts)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch, batch_vectors in zip(batches, executor.map(embed_batch, batches)):
+            for i, vector in zip(batch, batch_vectors):
+                vectors[i] = vector
+    return vectors
+
+
+def upsert_in_batches(index, vectors, max_items=100, max_bytes=3 * 1024 * 1024):
+    """
+    Upsert vectors to Pinecone in batches that stay under the 4MB request limit.
+    
+    Args:
+        index: Pinecone gRPC index handle
+        vectors (List[tuple]): (id, values, metadata) tuples
+        max_items (int): Maximum vectors per upsert request
+        max_bytes (int): Payload budget per upsert request
+    """
+    batch, batch_bytes = [], 0
+    for vector_id, values, metadata in vectors:
+        # gRPC sends values as packed float32; metadata and id are counted as JSON text
+        size = 4 * len(values) + len(vector_id) + len(json.dumps(metadata))
+        if batch and (batch_bytes + size > max_bytes or len(batch) >= max_items):
+            index.upsert(vectors=batch)
+            batch, batch_bytes = [], 0
+        batch.append((vector_id, values, metadata))
+        batch_bytes += size
+    if batch:
+        index.upsert(vectors=batch)
+
+
+def delete_vectors(index, vector_ids, batch_size=1000):
+    """Delete vectors from a Pinecone index by id, in batches."""
+    for start in range(0, len(vector_ids), batch_size):
+        index.delete(ids=vector_ids[start:start + batch_size])
+
+
+def to_pinecone_vectors(text_chunks, vectors, text_key="text"):
+    """
+    Pair document chunks with their embeddings as Pinecone upsert tuples.
+    
+    Metadata matches what PineconeVectorStore expects, so the index can be
+    queried with PineconeVectorStore.from_existing_index.
+    
+    Args:
+        text_chunks (List[Document]): Embedded chunks
+        vectors (List[List[float]]): One vector per chunk
+        text_key (str): Metadata key holding the chunk text
+        
+    Returns:
+        List[tuple]: (id, values, metadata) tuples with fresh ids
+    """
+    return [
+        (str(uuid.uuid4()), vector, {**chunk.metadata, text_key: chunk.page_content})
+        for chunk, vector in zip(text_chunks, vectors)
+    ]
+
+
+def encode_image_to_base64(image_path, max_size=1024, quality=85):
+    """
+    Encode an image file to a base64 JPEG string, downscaled for the vision model.
+    
+    Images are resized so the long edge is at most max_size pixels and
+    re-encoded as JPEG, which keeps the request payload small. Files Pillow
+    cannot read are sent unchanged.
     
     Args:
         image_path (str): Path to the image file
+        max_size (int): Maximum width/height in pixels
+        quality (int): JPEG quality used for re-encoding
         
     Returns:
         str: Base64 encoded image string
     """
+    mime_type, _ = mimetypes.guess_type(image_path)
+    if mime_type and mime_type.startswith("image/"):
+        try:
+            with Image.open(image_path) as img:
+                # Re-encoding drops EXIF, so apply the orientation tag to the pixels first
+                img = ImageOps.exif_transpose(img)
+                img.thumbnail((max_size, max_size), Image.LANCZOS)
+                buffer = io.BytesIO()
+                img.convert("RGB").save(buffer, "JPEG", quality=quality, optimize=True)
+            return base64.b64encode(buffer.getvalue()).decode('utf-8')
+        except (OSError, Image.DecompressionBombError):
+            pass
+    
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode('utf-8')
 
 
-def extract_nutrition_info_gpt4o(image_path, api_key=None, azure_endpoint=None):
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+
+
+def create_http_client():
     """
-    Extract nutritional information from a food product image using GPT-4o Vision.
+    Pooled keep-alive HTTP/2 client shared by the Azure OpenAI clients.
     
-    Args:
-        image_path (str): Path to the food product image
-        api_key (str, optional): NetAIConnect API key. If None, will use NETAICONNECT_API_KEY env variable
-        azure_endpoint (str, optional): Azure endpoint URL. Defaults to NetAIConnect endpoint
-        
     Returns:
-        dict: Extracted nutritional information in structured format
+        httpx.Client: HTTP client
+    """
+    return httpx.Client(limits=HTTP_LIMITS, http2=True, timeout=60.0)
+
+
+def create_async_http_client():
+    """
+    Async counterpart of create_http_client.
+    
+    The connection pool belongs to the event loop it is first used on, so
+    the client must always be used from the same loop.
+    
+    Returns:
+        httpx.AsyncClient: Async HTTP client
     """
+    return httpx.AsyncClient(limits=HTTP_LIMITS, http2=True, timeout=60.0)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_vision_client(api_key, azure_endpoint):
+    """Reusable GPT-4o Vision client, so connections survive between uploads."""
+    return AzureOpenAI(
+        api_key=api_key,
+        api_version="2024-02-15-preview",
+        azure_endpoint=azure_endpoint,
+        http_client=create_http_client()
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _get_async_vision_client(api_key, azure_endpoint):
+    """Reusable async GPT-4o Vision client (see create_async_http_client)."""
+    return AsyncAzureOpenAI(
+        api_key=api_key,
+        api_version="2024-02-15-preview",
+        azure_endpoint=azure_endpoint,
+        http_client=create_async_http_client()
+    )
+
+
+def _resolve_azure_credentials(api_key, azure_endpoint):
+    """Fill in the API key and endpoint defaults used by the vision calls."""
     # Get API key from environment if not provided
     if api_key is None:
         api_key = os.getenv("NETAICONNECT_API_KEY")
@@ -79,18 +466,12 @@ def extract_nutrition_info_gpt4o(image_path, api_key=None, azure_endpoint=None):
     if azure_endpoint is None:
         azure_endpoint = "https://netaiconnect.netapp.com/"
     
-    # Initialize Azure OpenAI client
-    client = AzureOpenAI(
-        api_key=api_key,
-        api_version="2024-02-15-preview",
-        azure_endpoint=azure_endpoint
-    )
-    
-    # Encode image to base64
-    base64_image = encode_image_to_base64(image_path)
-    
-    # Prepare the message with image
-    messages = [
+    return api_key, azure_endpoint
+
+
+def _build_extraction_messages(base64_image):
+    """Prepare the GPT-4o Vision messages for a base64 encoded label image."""
+    return [
         {
             "role": "system",
             "content": "You are an expert food product label analyzer with OCR capabilities."
@@ -111,39 +492,41 @@ def extract_nutrition_info_gpt4o(image_path, api_key=None, azure_endpoint=None):
             ]
         }
     ]
+
+
+# JSON object inside a ``` / ```json fence; without a fence, the outermost {...} in the text
+_FENCED_JSON_RE = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.DOTALL)
+_BARE_JSON_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def _find_json(text):
+    """Return the JSON object text from a model response, or None if there is none."""
+    json_match = _FENCED_JSON_RE.search(text)
+    if json_match is not None:
+        return json_match.group(1)
+    json_match = _BARE_JSON_RE.search(text)
+    return json_match.group() if json_match is not None else None
+
+
+def _parse_extraction_response(result_text):
+    """Parse the JSON nutrition data out of a GPT-4o Vision response."""
+    # JSON may be wrapped in markdown code blocks
+    json_str = _find_json(result_text)
+    if json_str is None:
+        return {
+            "success": False,
+            "error": "Failed to parse JSON: no JSON object found in response",
+            "raw_response": result_text
+        }
     
-    # Call GPT-4o Vision
-    response = client.chat.completions.create(
-        model="gpt-4o",  # GPT-4o model with vision capabilities
-        messages=messages,
-        max_tokens=2000,
-        temperature=0.1  # Low temperature for more consistent outputs
-    )
-    
-    # Extract the response content
-    result_text = response.choices[0].message.content
-    
-    # Try to parse JSON from the response
     try:
-        # Find JSON in the response (might be wrapped in markdown code blocks)
-        if "```json" in result_text:
-            json_start = result_text.find("```json") + 7
-            json_end = result_text.find("```", json_start)
-            json_str = result_text[json_start:json_end].strip()
-        elif "```" in result_text:
-            json_start = result_text.find("```") + 3
-            json_end = result_text.find("```", json_start)
-            json_str = result_text[json_start:json_end].strip()
-        else:
-            json_str = result_text
-            
-        nutrition_data = json.loads(json_str)
+        nutrition_data = orjson.loads(json_str)
         return {
             "success": True,
             "data": nutrition_data,
             "raw_response": result_text
         }
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         # If JSON parsing fails, return raw text
         return {
             "success": False,
@@ -152,6 +535,66 @@ def extract_nutrition_info_gpt4o(image_path, api_key=None, azure_endpoint=None):
         }
 
 
+def extract_nutrition_info_gpt4o(image_path, api_key=None, azure_endpoint=None):
+    """
+    Extract nutritional information from a food product image using GPT-4o Vision.
+    
+    Args:
+        image_path (str): Path to the food product image
+        api_key (str, optional): NetAIConnect API key. If None, will use NETAICONNECT_API_KEY env variable
+        azure_endpoint (str, optional): Azure endpoint URL. Defaults to NetAIConnect endpoint
+        
+    Returns:
+        dict: Extracted nutritional information in structured format
+    """
+    api_key, azure_endpoint = _resolve_azure_credentials(api_key, azure_endpoint)
+    
+    # Azure OpenAI client, reused across calls
+    client = _get_vision_client(api_key, azure_endpoint)
+    
+    # Encode image to base64
+    base64_image = encode_image_to_base64(image_path)
+    
+    # Call GPT-4o Vision
+    response = client.chat.completions.create(
+        model="gpt-4o",  # GPT-4o model with vision capabilities
+        messages=_build_extraction_messages(base64_image),
+        max_tokens=2000,
+        temperature=0.1  # Low temperature for more consistent outputs
+    )
+    
+    return _parse_extraction_response(response.choices[0].message.content)
+
+
+async def aextract_nutrition_info_gpt4o(image_path, api_key=None, azure_endpoint=None):
+    """
+    Async version of extract_nutrition_info_gpt4o.
+    
+    Args:
+        image_path (str): Path to the food product image
+        api_key (str, optional): NetAIConnect API key. If None, will use NETAICONNECT_API_KEY env variable
+        azure_endpoint (str, optional): Azure endpoint URL. Defaults to NetAIConnect endpoint
+        
+    Returns:
+        dict: Extracted nutritional information in structured format
+    """
+    api_key, azure_endpoint = _resolve_azure_credentials(api_key, azure_endpoint)
+    
+    client = _get_async_vision_client(api_key, azure_endpoint)
+    
+    # Resizing is CPU bound, keep it off the event loop
+    base64_image = await asyncio.to_thread(encode_image_to_base64, image_path)
+    
+    response = await client.chat.completions.create(
+        model="gpt-4o",
+        messages=_build_extraction_messages(base64_image),
+        max_tokens=2000,
+        temperature=0.1
+    )
+    
+    return _parse_extraction_response(response.choices[0].message.content)
+
+
 def analyze_food_product(image_path, api_key=None):
     """
     High-level function to analyze a food product image.
@@ -239,37 +682,54 @@ def display_nutrition_summary(nutrition_data):
     print("\n" + "="*60)
 
 
-def allowed_file(filename, allowed_extensions):
+def build_product_context(product_data, inr_result):
     """
-    Check if file extension is allowed.
+    Format the product chat prompt once per analysed product.
+    
+    The returned string still contains a ``{user_msg}`` placeholder that is
+    replaced with the question on every chat turn.
     
     Args:
-        filename (str): Name of the file
-        allowed_extensions (set): Set of allowed file extensions
+        product_data (dict): Product nutritional data
+        inr_result (dict): INR score result
         
     Returns:
-        bool: True if file extension is allowed, False otherwise
+        str: Product context template
     """
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
+    nutrition = product_data['nutritional_info_per_100g']
+    return PRODUCT_CONTEXT_TEMPLATE.format(
+        product_name=product_data.get('product_name', 'Unknown'),
+        brand=product_data.get('brand', 'Unknown'),
+        product_type=product_data.get('product_type', 'Solid'),
+        inr_score=inr_result['inr_score'],
+        grade=inr_result['grade'],
+        energy_kcal=nutrition['energy_kcal'],
+        sugars_g=nutrition['sugars_g'],
+        saturated_fat_g=nutrition['saturated_fat_g'],
+        sodium_mg=nutrition['sodium_mg'],
+        protein_g=nutrition['protein_g'],
+        health_warnings=', '.join(inr_result.get('health_warnings', [])) or 'None',
+        positive_claims=', '.join(inr_result.get('positive_claims', [])) or 'None'
+    )
 
 
-def calculate_inr_score(product_data, analysis, fssai_inr_baseline, o3_client):
+def allowed_file(filename, allowed_extensions):
     """
-    Calculate INR score using o3-mini reasoning model.
+    Check if file extension is allowed.
     
     Args:
-        product_data (dict): Product nutritional data
-        analysis (dict): Nutrient analysis with % of INR
-        fssai_inr_baseline (dict): FSSAI baseline values
-        o3_client: Azure OpenAI client for o3-mini
+        filename (str): Name of the file
+        allowed_extensions (tuple): Allowed lowercase extensions including the dot, e.g. ('.png', '.jpg')
         
     Returns:
-        dict: INR score result with negative points, positive points, score, grade, etc.
+        bool: True if file extension is allowed, False otherwise
     """
-    import re
-    import json
-    
-    reasoning_prompt = f"""You are an expert food nutrition analyst tasked with calculating the Indian Nutrition Rating (INR) score for a food product based on FSSAI guidelines.
+    return filename.lower().endswith(allowed_extensions)
+
+
+def _build_inr_prompt(product_data, analysis, fssai_inr_baseline):
+    """Build the o3-mini reasoning prompt for the INR score."""
+    return f"""You are an expert food nutrition analyst tasked with calculating the Indian Nutrition Rating (INR) score for a food product based on FSSAI guidelines.
 
 **Product Information:**
 - Product Type: {product_data.get('product_type', 'Solid')}
@@ -321,21 +781,79 @@ Calculate the Indian Nutrition Rating (INR) score (0-100) using this methodology
     "positive_claims": [<list>]
 }}
 """
+
+
+def _parse_inr_response(response_text):
+    """Parse the INR score JSON from an o3-mini response (JSON mode, so the content is the object itself)."""
+    if not response_text:
+        return None
+    try:
+        return orjson.loads(response_text)
+    except orjson.JSONDecodeError:
+        return None
+
+
+def calculate_inr_score(product_data, analysis, fssai_inr_baseline, o3_client):
+    """
+    Calculate INR score using o3-mini reasoning model.
     
+    Args:
+        product_data (dict): Product nutritional data
+        analysis (dict): Nutrient analysis with % of INR
+        fssai_inr_baseline (dict): FSSAI baseline values
+        o3_client: Azure OpenAI client for o3-mini
+        
+    Returns:
+        dict: INR score result with negative points, positive points, score, grade, etc.
+    """
     response = o3_client.chat.completions.create(
         model="o3-mini",
-        messages=[{"role": "user", "content": reasoning_prompt}],
+        messages=[{"role": "user", "content": _build_inr_prompt(product_data, analysis, fssai_inr_baseline)}],
         temperature=1,
-        max_completion_tokens=5000
+        response_format={"type": "json_object"},
+        max_completion_tokens=2500
     )
     
     # Parse JSON from response
-    response_text = response.choices[0].message.content
-    json_match = re.search(r'\{[\s\S]*\}', response_text)
+    return _parse_inr_response(response.choices[0].message.content)
+
+
+async def acalculate_inr_score(product_data, analysis, fssai_inr_baseline, o3_async_client):
+    """
+    Async version of calculate_inr_score.
     
-    if json_match:
-        return json.loads(json_match.group())
-    return None
+    Args:
+        product_data (dict): Product nutritional data
+        analysis (dict): Nutrient analysis with % of INR
+        fssai_inr_baseline (dict): FSSAI baseline values
+        o3_async_client: AsyncAzureOpenAI client for o3-mini
+        
+    Returns:
+        dict: INR score result with negative points, positive points, score, grade, etc.
+    """
+    response = await o3_async_client.chat.completions.create(
+        model="o3-mini",
+        messages=[{"role": "user", "content": _build_inr_prompt(product_data, analysis, fssai_inr_baseline)}],
+        temperature=1,
+        response_format={"type": "json_object"},
+        max_completion_tokens=2500
+    )
+    
+    return _parse_inr_response(response.choices[0].message.content)
+
+
+NUTRIENT_KEYS = ('energy_kcal', 'sugars_g', 'saturated_fat_g', 'sodium_mg', 'protein_g', 'fiber_g')
+_MISSING_VALUES = ("Not Available", "N/A", None)
+
+
+def _safe_float(value):
+    """Convert a label value to float, returning NaN when it is missing or not numeric."""
+    if value in _MISSING_VALUES:
+        return np.nan
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return np.nan
 
 
 def calculate_nutrient_analysis(product_nutrition, fssai_inr_baseline):
@@ -349,50 +867,39 @@ def calculate_nutrient_analysis(product_nutrition, fssai_inr_baseline):
     Returns:
         dict: Analysis with per_100g, inr_baseline, and percent_of_inr for each nutrient
     """
-    analysis = {}
-    nutrients = ['energy_kcal', 'sugars_g', 'saturated_fat_g', 'sodium_mg', 'protein_g']
+    values = np.fromiter(
+        (_safe_float(product_nutrition.get(key)) for key in NUTRIENT_KEYS),
+        dtype=np.float64,
+        count=len(NUTRIENT_KEYS)
+    )
+    baselines = np.fromiter(
+        (fssai_inr_baseline.get(key, 1) for key in NUTRIENT_KEYS),
+        dtype=np.float64,
+        count=len(NUTRIENT_KEYS)
+    )
     
-    for nutrient in nutrients:
-        value = product_nutrition.get(nutrient, 0)
-        if value == "Not Available" or value is None or value == "N/A":
-            value = 0
-        else:
-            # Convert to float to handle string values
-            try:
-                value = float(value)
-            except (ValueError, TypeError):
-                value = 0
-        
-        baseline_key = nutrient
-        if baseline_key not in fssai_inr_baseline:
-            # Map to correct baseline key
-            baseline_key = nutrient
-            
-        baseline = fssai_inr_baseline.get(baseline_key, 1)
-        
-        analysis[nutrient] = {
+    # Fiber is only reported when the label declares it; other nutrients default to 0
+    fiber_available = not np.isnan(values[-1])
+    values = np.nan_to_num(values, nan=0.0)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percents = np.where(baselines != 0, values / baselines * 100.0, 0.0)
+    
+    analysis = {}
+    for key, value, percent in zip(NUTRIENT_KEYS, values.tolist(), percents.tolist()):
+        if key == 'fiber_g' and not fiber_available:
+            continue
+        analysis[key] = {
             "per_100g": value,
-            "inr_baseline": baseline,
-            "percent_of_inr": (value / baseline * 100) if value and baseline else 0
+            "inr_baseline": fssai_inr_baseline.get(key, 1),
+            "percent_of_inr": percent
         }
     
-    # Add fiber if available
-    fiber = product_nutrition.get('fiber_g')
-    if fiber != "Not Available" and fiber is not None and fiber != "N/A":
-        try:
-            fiber = float(fiber)
-            analysis['fiber_g'] = {
-                "per_100g": fiber,
-                "inr_baseline": fssai_inr_baseline['fiber_g'],
-                "percent_of_inr": (fiber / fssai_inr_baseline['fiber_g'] * 100)
-            }
-        except (ValueError, TypeError):
-            pass
-    
     return analysis
 
 
-def create_nutrition_analysis_chain(api_key, fssai_inr_baseline, o3_client):
+def create_nutrition_analysis_chain(api_key, fssai_inr_baseline, o3_client, o3_async_client=None,
+                                    vision_cache=None, inr_cache=None):
     """
     Create a LangChain SequentialChain for complete nutrition analysis pipeline.
     
@@ -401,23 +908,24 @@ def create_nutrition_analysis_chain(api_key, fssai_inr_baseline, o3_client):
     2. Calculate nutrient analysis (% of INR)
     3. Calculate INR score (o3-mini reasoning)
     
+    Every step has an async implementation, so the chain can be run with
+    ``ainvoke`` / ``abatch`` and several images analysed concurrently.
+    
     Args:
         api_key (str): NetAIConnect API key
         fssai_inr_baseline (dict): FSSAI baseline values
         o3_client: Azure OpenAI client for o3-mini
+        o3_async_client (optional): AsyncAzureOpenAI client for o3-mini, used by ``ainvoke``.
+            If None, the sync client is run in a worker thread.
+        vision_cache (ResultStore, optional): Extracted nutrition keyed by image content hash
+        inr_cache (ResultStore, optional): INR results keyed by hash of the product data
         
     Returns:
         RunnableSequence: LangChain sequential chain
     """
-    from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+    from langchain_core.runnables import RunnableLambda
     
-    # Step 1: Extract nutrition information using GPT-4o Vision
-    def extract_nutrition_step(inputs):
-        """Extract nutrition from image"""
-        image_path = inputs if isinstance(inputs, str) else inputs.get('image_path')
-        
-        extraction_result = extract_nutrition_info_gpt4o(image_path, api_key=api_key)
-        
+    def _extraction_output(image_path, extraction_result):
         if not extraction_result['success']:
             return {
                 'success': False,
@@ -432,6 +940,72 @@ def create_nutrition_analysis_chain(api_key, fssai_inr_baseline, o3_client):
             'product_data': extraction_result['data']
         }
     
+    def _inr_output(inputs, inr_result):
+        if inr_result is None:
+            return {
+                'success': False,
+                'error': 'INR score calculation failed',
+                'image_path': inputs['image_path']
+            }
+        
+        return {
+            'success': True,
+            'image_path': inputs['image_path'],
+            'product_data': inputs['product_data'],
+            'analysis': inputs['analysis'],
+            'inr_result': inr_result
+        }
+    
+    def _vision_lookup(image_path):
+        """Return (cache key, cached product data) for an image; re-uploads skip GPT-4o Vision"""
+        if vision_cache is None:
+            return None, None
+        key = file_sha256(image_path)
+        return key, vision_cache.get(key)
+    
+    def _vision_store(key, extraction_result):
+        if key is not None and extraction_result['success']:
+            vision_cache.set(key, extraction_result['data'])
+    
+    def _inr_key(product_data):
+        return hashlib.sha256(orjson.dumps(product_data, option=orjson.OPT_SORT_KEYS)).hexdigest()
+    
+    def _inr_lookup(product_data):
+        """Return (cache key, cached INR result) for the extracted product data"""
+        if inr_cache is None:
+            return None, None
+        key = _inr_key(product_data)
+        return key, inr_cache.get(key)
+    
+    def _inr_store(key, inr_result):
+        if key is not None and inr_result is not None:
+            inr_cache.set(key, inr_result)
+    
+    # Step 1: Extract nutrition information using GPT-4o Vision
+    def extract_nutrition_step(inputs):
+        """Extract nutrition from image"""
+        image_path = inputs if isinstance(inputs, str) else inputs.get('image_path')
+        
+        key, cached = _vision_lookup(image_path)
+        if cached is not None:
+            return _extraction_output(image_path, {'success': True, 'data': cached})
+        
+        extraction_result = extract_nutrition_info_gpt4o(image_path, api_key=api_key)
+        _vision_store(key, extraction_result)
+        return _extraction_output(image_path, extraction_result)
+    
+    async def aextract_nutrition_step(inputs):
+        """Extract nutrition from image (async)"""
+        image_path = inputs if isinstance(inputs, str) else inputs.get('image_path')
+        
+        key, cached = await asyncio.to_thread(_vision_lookup, image_path)
+        if cached is not None:
+            return _extraction_output(image_path, {'success': True, 'data': cached})
+        
+        extraction_result = await aextract_nutrition_info_gpt4o(image_path, api_key=api_key)
+        await asyncio.to_thread(_vision_store, key, extraction_result)
+        return _extraction_output(image_path, extraction_result)
+    
     # Step 2: Calculate nutrient analysis (% of INR)
     def calculate_analysis_step(inputs):
         """Calculate nutrient analysis"""
@@ -452,42 +1026,51 @@ def create_nutrition_analysis_chain(api_key, fssai_inr_baseline, o3_client):
             'analysis': analysis
         }
     
+    async def acalculate_analysis_step(inputs):
+        """Calculate nutrient analysis (pure CPU, no I/O to await)"""
+        return calculate_analysis_step(inputs)
+    
     # Step 3: Calculate INR score using o3-mini reasoning
     def calculate_inr_step(inputs):
         """Calculate INR score"""
         if not inputs.get('success'):
             return inputs  # Pass through errors
         
-        product_data = inputs['product_data']
-        analysis = inputs['analysis']
+        key, inr_result = _inr_lookup(inputs['product_data'])
+        if inr_result is None:
+            inr_result = calculate_inr_score(
+                inputs['product_data'], 
+                inputs['analysis'], 
+                fssai_inr_baseline, 
+                o3_client
+            )
+            _inr_store(key, inr_result)
+        return _inr_output(inputs, inr_result)
+    
+    async def acalculate_inr_step(inputs):
+        """Calculate INR score (async)"""
+        if not inputs.get('success'):
+            return inputs  # Pass through errors
         
-        inr_result = calculate_inr_score(
-            product_data, 
-            analysis, 
-            fssai_inr_baseline, 
-            o3_client
-        )
+        if o3_async_client is None:
+            return await asyncio.to_thread(calculate_inr_step, inputs)
         
+        key, inr_result = await asyncio.to_thread(_inr_lookup, inputs['product_data'])
         if inr_result is None:
-            return {
-                'success': False,
-                'error': 'INR score calculation failed',
-                'image_path': inputs['image_path']
-            }
-        
-        return {
-            'success': True,
-            'image_path': inputs['image_path'],
-            'product_data': product_data,
-            'analysis': analysis,
-            'inr_result': inr_result
-        }
+            inr_result = await acalculate_inr_score(
+                inputs['product_data'], 
+                inputs['analysis'], 
+                fssai_inr_baseline, 
+                o3_async_client
+            )
+            await asyncio.to_thread(_inr_store, key, inr_result)
+        return _inr_output(inputs, inr_result)
     
     # Create the LangChain sequential chain using LCEL
     chain = (
-        RunnableLambda(extract_nutrition_step)
-        | RunnableLambda(calculate_analysis_step)
-        | RunnableLambda(calculate_inr_step)
+        RunnableLambda(extract_nutrition_step, afunc=aextract_nutrition_step)
+        | RunnableLambda(calculate_analysis_step, afunc=acalculate_analysis_step)
+        | RunnableLambda(calculate_inr_step, afunc=acalculate_inr_step)
     )
     
     return chain
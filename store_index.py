@@ -1,6 +1,6 @@
 from langchain_openai import AzureOpenAIEmbeddings
-from pinecone import Pinecone
-from langchain_pinecone import PineconeVectorStore
+# gRPC client: vectors go over the wire as packed float32 instead of JSON text
+from pinecone.grpc import PineconeGRPC as Pinecone
 from pinecone import ServerlessSpec
 import src.helper as helper
 import os
@@ -14,41 +14,93 @@ os.environ["PINECONE_API_KEY"] = PINECONE_API_KEY
 os.environ["NETAICONNECT_API_KEY"] = NETAICONNECT_API_KEY
 
 
-extracted_data=helper.upload_pdf('data/')
-filter_data = helper.filter_to_minimal_docs(extracted_data)
-text_chunks=helper.text_split(filter_data)
-
-# Initialize Azure OpenAI Embeddings
-embeddings = AzureOpenAIEmbeddings(
-    model="text-embedding-ada-002",
-    azure_endpoint="https://netaiconnect.netapp.com/",
-    api_key=NETAICONNECT_API_KEY, # Add your NetAIConnect API key here
-    openai_api_version="2023-05-15",
-) 
-
-# Initialize Pinecone client
-pc = Pinecone(api_key=PINECONE_API_KEY)
-
-index_name = "purecheck-index"
-# Create Pinecone index if it doesn't exist
-if not pc.has_index(index_name):
-    pc.create_index(
-        name = index_name,
-        dimension=1536,  # Dimension of the embeddings
-        metric= "cosine",  # Cosine similarity
-        spec=ServerlessSpec(cloud="aws", region="us-east-1")
-    )
-# Connect to Pinecone index
-index = pc.Index(index_name)
-
-# Upload in very small batches to avoid exceeding Pinecone's 4MB limit
-# Using batch_size=5 for safety with large documents
-docsearch = PineconeVectorStore.from_documents(
-    documents=text_chunks,
-    embedding=embeddings,
-    index_name=index_name,
-    batch_size=5,  # Very small batch size to stay well under 4MB limit
-    embeddings_chunk_size=5  # Also limit embedding batch size
-)
-
-print("Documents uploaded to Pinecone index successfully.")
\ No newline at end of file
+MANIFEST_PATH = "index_manifest.json"
+
+
+def main():
+    # Initialize Azure OpenAI Embeddings
+    embeddings = AzureOpenAIEmbeddings(
+        model="text-embedding-ada-002",
+        azure_endpoint="https://netaiconnect.netapp.com/",
+        api_key=NETAICONNECT_API_KEY, # Add your NetAIConnect API key here
+        openai_api_version="2023-05-15",
+    ) 
+
+    # Initialize Pinecone client
+    pc = Pinecone(api_key=PINECONE_API_KEY)
+
+    # Record of already indexed PDFs (mtime, sha256, vector ids)
+    manifest_exists = os.path.exists(MANIFEST_PATH)
+    manifest = helper.load_index_manifest(MANIFEST_PATH)
+
+    index_name = "purecheck-index"
+    # Create Pinecone index if it doesn't exist
+    if not pc.has_index(index_name):
+        pc.create_index(
+            name = index_name,
+            dimension=1536,  # Dimension of the embeddings
+            metric= "cosine",  # Cosine similarity
+            spec=ServerlessSpec(cloud="aws", region="us-east-1")
+        )
+        manifest = {}  # Fresh index, nothing is indexed yet
+        # Connect to Pinecone index
+        index = pc.Index(index_name)
+    else:
+        # Connect to Pinecone index
+        index = pc.Index(index_name)
+        # Vectors from earlier runs aren't tracked; start clean instead of duplicating them.
+        # An empty index is skipped: deleting from a namespace that doesn't exist yet fails
+        if not manifest_exists and index.describe_index_stats().total_vector_count > 0:
+            print("No index manifest found, clearing existing vectors before re-indexing")
+            index.delete(delete_all=True)
+
+    # Only PDFs that are new or whose content changed are re-split and re-embedded
+    pdf_paths = helper.find_pdfs('data/')
+    changed, removed, fingerprints = helper.diff_index_manifest(pdf_paths, manifest)
+    print(f"{len(pdf_paths) - len(changed)} PDFs unchanged, {len(changed)} to index, {len(removed)} removed")
+
+    # Drop vectors of PDFs that were deleted
+    for path in removed:
+        helper.delete_vectors(index, manifest[path]["vector_ids"])
+        del manifest[path]
+        helper.save_index_manifest(MANIFEST_PATH, manifest)
+
+    if changed:
+        # PDFs are loaded in parallel worker processes
+        extracted_data = helper.load_pdfs(changed)
+        filter_data = helper.filter_to_minimal_docs(extracted_data)
+        text_chunks=helper.text_split(filter_data)
+
+        # Embed all changed PDFs in large token-packed batches sent concurrently
+        vectors = helper.embed_in_batches(embeddings, [chunk.page_content for chunk in text_chunks])
+        pinecone_vectors = helper.to_pinecone_vectors(text_chunks, vectors)
+
+        vectors_by_path = {path: [] for path in changed}
+        for chunk, vector in zip(text_chunks, pinecone_vectors):
+            vectors_by_path[chunk.metadata["source"]].append(vector)
+
+        for path, path_vectors in vectors_by_path.items():
+            old_ids = manifest.get(path, {}).get("vector_ids", [])
+            new_ids = [vector_id for vector_id, _, _ in path_vectors]
+
+            # Record the new ids before uploading without a fingerprint, so an
+            # interrupted run re-indexes this PDF and cleans up both sets
+            manifest[path] = {"mtime": None, "sha256": None, "vector_ids": old_ids + new_ids}
+            helper.save_index_manifest(MANIFEST_PATH, manifest)
+
+            # Upsert in batches sized to stay under Pinecone's 4MB request limit,
+            # then drop the previous version of this PDF
+            helper.upsert_in_batches(index, path_vectors)
+            helper.delete_vectors(index, old_ids)
+
+            manifest[path] = {**fingerprints[path], "vector_ids": new_ids}
+            helper.save_index_manifest(MANIFEST_PATH, manifest)
+
+    helper.save_index_manifest(MANIFEST_PATH, manifest)
+
+    print("Documents uploaded to Pinecone index successfully.")
+
+
+# Guard needed so worker processes spawned for PDF loading don't re-run the script
+if __name__ == "__main__":
+    main()